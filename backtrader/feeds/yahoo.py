@@ -20,17 +20,15 @@
 ###############################################################################
                         
 
-import collections
 from datetime import date, datetime
 import io
-import itertools
 
 from ..utils.py3 import (urlopen, urlquote, ProxyHandler, build_opener,
                          install_opener)
 
 import backtrader as bt
 from .. import feed
-from ..utils import date2num
+from ..utils import date2num, ordinal2num, time2terms
 
 
 class YahooFinanceCSVData(feed.CSVDataBase):
@@ -92,87 +90,111 @@ class YahooFinanceCSVData(feed.CSVDataBase):
     def start(self):
         super(YahooFinanceCSVData, self).start()
 
+        # Parameters are fixed during the run. Resolve them once instead of
+        # looking them up for each line in _loadline
+        self._swapcloses = self.p.swapcloses
+        self._adjclose = self.p.adjclose
+        self._adjvolume = self.p.adjclose and self.p.adjvolume
+        self._round = self.p.round
+        self._decimals = self.p.decimals
+        self._roundvolume = self.p.roundvolume
+        self._isodate = True  # until a date cannot be parsed as ISO
+
+        # Terms of date2num for the (constant) session end time, to get the
+        # same float as date2num(datetime.combine(dt, sessionend)) without a
+        # datetime instance per line. Not possible with a timezone, because
+        # the utc offset may depend on the date
+        sessionend = self.p.sessionend
+        self._sessterms = None
+        if sessionend.tzinfo is None:
+            self._sessterms = time2terms(sessionend)
+
+        # Bind the line buffers once, saving the attribute chain per line
+        lines = self.lines
+        self._lbufs = (lines.datetime, lines.open, lines.high, lines.low,
+                       lines.close, lines.volume, lines.openinterest,
+                       lines.adjclose)
+
         if not self.params.reverse:
             return
 
         # Yahoo sends data in reverse order and the file is still unreversed
-        dq = collections.deque()
-        for line in self.f:
-            dq.appendleft(line)
+        flines = self.f.readlines()
+        flines.reverse()
 
-        f = io.StringIO(newline=None)
-        f.writelines(dq)
-        f.seek(0)
+        f = io.StringIO(''.join(flines), newline=None)
         self.f.close()
         self.f = f
 
     def _loadline(self, linetokens):
-        while True:
-            nullseen = False
-            for tok in linetokens[1:]:
-                if tok == 'null':
-                    nullseen = True
-                    linetokens = self._getnextline()  # refetch tokens
-                    if not linetokens:
-                        return False  # cannot fetch, go away
-
-                    # out of for to carry on wiwth while True logic
-                    break
-
-            if not nullseen:
-                break  # can proceed
-
-        i = itertools.count(0)
-
-        dttxt = linetokens[next(i)]
-        dt = date(int(dttxt[0:4]), int(dttxt[5:7]), int(dttxt[8:10]))
-        dtnum = date2num(datetime.combine(dt, self.p.sessionend))
-
-        self.lines.datetime[0] = dtnum
-        o = float(linetokens[next(i)])
-        h = float(linetokens[next(i)])
-        l = float(linetokens[next(i)])
-        c = float(linetokens[next(i)])
-        self.lines.openinterest[0] = 0.0
+        # skip lines with "null" values (the membership test is done at C
+        # level instead of looping over the tokens)
+        while 'null' in linetokens:
+            linetokens = self._getnextline()  # refetch tokens
+            if not linetokens:
+                return False  # cannot fetch, go away
 
         # 2018-11-16 ... Adjusted Close seems to always be delivered after
         # the close and before the volume columns
-        adjustedclose = float(linetokens[next(i)])
+        dttxt, o, h, l, c, adjustedclose = linetokens[0:6]
+
+        dt = None
+        if self._isodate:
+            try:
+                dt = date.fromisoformat(dttxt[0:10])  # single C level parse
+            except ValueError:  # not ISO, go for slicing from now on
+                self._isodate = False
+
+        if dt is None:  # fields are still in YYYY?MM?DD
+            dt = date(int(dttxt[0:4]), int(dttxt[5:7]), int(dttxt[8:10]))
+
+        if self._sessterms is not None:
+            dtnum = ordinal2num(dt.toordinal(), self._sessterms)
+        else:
+            dtnum = date2num(datetime.combine(dt, self.p.sessionend))
+
+        o = float(o)
+        h = float(h)
+        l = float(l)
+        c = float(c)
+        adjustedclose = float(adjustedclose)
         try:
-            v = float(linetokens[next(i)])
+            v = float(linetokens[6])
         except:  # cover the case in which volume is "null"
             v = 0.0
 
-        if self.p.swapcloses:  # swap closing prices if requested
+        if self._swapcloses:  # swap closing prices if requested
             c, adjustedclose = adjustedclose, c
 
-        adjfactor = c / adjustedclose
-
         # in v7 "adjusted prices" seem to be given, scale back for non adj
-        if self.params.adjclose:
+        if self._adjclose:
+            adjfactor = c / adjustedclose
             o /= adjfactor
             h /= adjfactor
             l /= adjfactor
             c = adjustedclose
             # If the price goes down, volume must go up and viceversa
-            if self.p.adjvolume:
+            if self._adjvolume:
                 v *= adjfactor
 
-        if self.p.round:
-            decimals = self.p.decimals
+        if self._round:
+            decimals = self._decimals
             o = round(o, decimals)
             h = round(h, decimals)
             l = round(l, decimals)
             c = round(c, decimals)
 
-        v = round(v, self.p.roundvolume)
+        v = round(v, self._roundvolume)
 
-        self.lines.open[0] = o
-        self.lines.high[0] = h
-        self.lines.low[0] = l
-        self.lines.close[0] = c
-        self.lines.volume[0] = v
-        self.lines.adjclose[0] = adjustedclose
+        ldt, lo, lh, ll, lc, lv, loi, ladjc = self._lbufs
+        ldt[0] = dtnum
+        lo[0] = o
+        lh[0] = h
+        ll[0] = l
+        lc[0] = c
+        lv[0] = v
+        loi[0] = 0.0
+        ladjc[0] = adjustedclose
 
         return True
 
@@ -249,6 +271,8 @@ class YahooFinanceData(YahooFinanceCSVData):
         ('retries', 3),
     )
 
+    _crumbs = dict()  # crumb and session shared by all instances
+
     def start_v7(self):
         try:
             import requests
@@ -259,15 +283,51 @@ class YahooFinanceData(YahooFinanceCSVData):
             raise Exception(msg)
 
         self.error = None
-        url = self.p.urlhist.format(self.p.dataname)
 
         sesskwargs = dict()
         if self.p.proxies:
             sesskwargs['proxies'] = self.p.proxies
 
-        crumb = None
-        sess = requests.Session()
-        sess.headers['User-Agent'] = 'backtrader'
+        # The crumb is tied to the session cookies and not to the ticker. Reuse
+        # it and the session across instances to save a roundtrip per data
+        # and to keep the pooled (keep-alive) connections to Yahoo
+        proxies = sesskwargs.get('proxies') or {}
+        crumbkey = (self.p.urlhist, self.p.urldown,
+                    tuple(sorted(proxies.items())))
+
+        f = None
+        while True:
+            crumb, sess = self._crumbs.get(crumbkey, (None, None))
+            cached = crumb is not None
+            if not cached:
+                sess = requests.Session()
+                sess.headers['User-Agent'] = 'backtrader'
+                crumb = self._getcrumb(requests, sess, sesskwargs)
+                if crumb is None:
+                    self.error = 'Crumb not found'
+                    sess.close()
+                    break
+
+                self._crumbs[crumbkey] = (crumb, sess)
+
+            f, rejected = self._download(requests, sess, crumb, sesskwargs)
+            if f is not None:
+                self.error = None  # errors of failed attempts do not apply
+                break
+
+            # do not let other instances use a crumb/session which failed
+            self._crumbs.pop(crumbkey, None)
+            sess.close()
+            if not (cached and rejected):
+                break
+
+            # the cached crumb was rejected (expired?): get a new one once
+
+        self.f = f
+
+    def _getcrumb(self, requests, sess, sesskwargs):
+        url = self.p.urlhist.format(self.p.dataname)
+
         for i in range(self.p.retries + 1):  # at least once
             resp = sess.get(url, **sesskwargs)
             if resp.status_code != requests.codes.ok:
@@ -289,30 +349,26 @@ class YahooFinanceData(YahooFinanceCSVData):
                 continue
 
             crumb = txt[istart:iend]
-            crumb = crumb.encode('ascii').decode('unicode-escape')
-            break
-
-        if crumb is None:
-            self.error = 'Crumb not found'
-            self.f = None
-            return
+            return crumb.encode('ascii').decode('unicode-escape')
 
-        crumb = urlquote(crumb)
+        return None
 
+    def _download(self, requests, sess, crumb, sesskwargs):
         # urldown/ticker?period1=posix1&period2=posix2&interval=1d&events=history&crumb=crumb
 
         # Try to download
         urld = '{}/{}'.format(self.p.urldown, self.p.dataname)
 
         urlargs = []
-        posix = date(1970, 1, 1)
+        # posix timestamps (of the dates) from the ordinals, with plain ints
+        posix = date(1970, 1, 1).toordinal()
         if self.p.todate is not None:
-            period2 = (self.p.todate.date() - posix).total_seconds()
-            urlargs.append('period2={}'.format(int(period2)))
+            period2 = (self.p.todate.toordinal() - posix) * 86400
+            urlargs.append('period2={}'.format(period2))
 
-        if self.p.todate is not None:
-            period1 = (self.p.fromdate.date() - posix).total_seconds()
-            urlargs.append('period1={}'.format(int(period1)))
+        if self.p.fromdate is not None:
+            period1 = (self.p.fromdate.toordinal() - posix) * 86400
+            urlargs.append('period1={}'.format(period1))
 
         intervals = {
             bt.TimeFrame.Days: '1d',
@@ -322,12 +378,16 @@ class YahooFinanceData(YahooFinanceCSVData):
 
         urlargs.append('interval={}'.format(intervals[self.p.timeframe]))
         urlargs.append('events=history')
-        urlargs.append('crumb={}'.format(crumb))
+        urlargs.append('crumb={}'.format(urlquote(crumb)))
 
         urld = '{}?{}'.format(urld, '&'.join(urlargs))
-        f = None
         for i in range(self.p.retries + 1):  # at least once
             resp = sess.get(urld, **sesskwargs)
+            if resp.status_code in (401, 403):
+                # crumb/cookie not accepted, retrying with it is pointless
+                self.error = 'Crumb rejected: %d' % resp.status_code
+                return None, True
+
             if resp.status_code != requests.codes.ok:
                 continue
 
@@ -340,13 +400,11 @@ class YahooFinanceData(YahooFinanceCSVData):
             # buffer everything from the socket into a local buffer
             try:
                 # r.encoding = 'UTF-8'
-                f = io.StringIO(resp.text, newline=None)
+                return io.StringIO(resp.text, newline=None), False
             except Exception:
                 continue  # try again if possible
 
-            break
-
-        self.f = f
+        return None, False
 
     def start(self):
         self.start_v7()
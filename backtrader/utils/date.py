@@ -21,7 +21,9 @@
 
 
 from .dateintern import (num2date, num2dt, date2num, time2num, num2time,
+                         time2terms, ordinal2num,
                          UTC, TZLocal, Localizer, tzparse, TIME_MAX, TIME_MIN)
 
 __all__ = ('num2date', 'num2dt', 'date2num', 'time2num', 'num2time',
+           'time2terms', 'ordinal2num',
            'UTC', 'TZLocal', 'Localizer', 'tzparse', 'TIME_MAX', 'TIME_MIN')
@@ -225,6 +225,25 @@ def date2num(dt, tz=None):
     return base
 
 
+def time2terms(tm):
+    """
+    Returns the hour/minute/second/microsecond parts of tm as the fractions
+    of a day which date2num adds to the ordinal (keep both in sync). No
+    timezone is applied.
+    """
+    return (tm.hour / HOURS_PER_DAY, tm.minute / MINUTES_PER_DAY,
+            tm.second / SECONDS_PER_DAY, tm.microsecond / MUSECONDS_PER_DAY)
+
+
+def ordinal2num(ordinal, terms=()):
+    """
+    Same as date2num for a naive datetime given as the ordinal of the date
+    and the terms of the time (see time2terms), which allows reusing the
+    terms when the time is constant.
+    """
+    return math.fsum((ordinal,) + terms)
+
+
 def time2num(tm):
     """
     Converts the hour/minute/second/microsecond part of tm (datetime.datetime
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2015-2023 Daniel Rodriguez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+
+import datetime
+import os.path
+import sys
+import tempfile
+import types
+from unittest import mock
+
+import testcommon
+
+import backtrader as bt
+
+CSVTEXT = ('Date,Open,High,Low,Close,Adj Close,Volume\n'
+           '2014-01-02,40.369999,40.490002,39.310001,39.590000,39.590000,'
+           '21504200\n')
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, text='', ctype='text/csv'):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {'Content-Type': ctype}
+
+
+class FakeRequests(object):
+    '''Stands in for the requests module. ``crumbs`` are served in order by
+    the history page and ``downstatus`` is the status of the downloads'''
+
+    def __init__(self, crumbs=('abc',), downstatus=200):
+        self.crumbs = list(crumbs)
+        self.downstatus = downstatus
+        self.histcalls = []
+        self.downcalls = []
+        self.sessions = []
+
+        fake = self
+
+        class Session(object):
+            def __init__(self):
+                self.headers = dict()
+                self.closed = False
+                fake.sessions.append(self)
+
+            def get(self, url, **kwargs):
+                return fake.get(url)
+
+            def close(self):
+                self.closed = True
+
+        self.module = types.ModuleType('requests')
+        self.module.Session = Session
+        self.module.codes = types.SimpleNamespace(ok=200)
+
+    def get(self, url):
+        if '/quote/' in url:  # history page with the crumb
+            self.histcalls.append(url)
+            crumb = self.crumbs.pop(0) if self.crumbs else ''
+            return FakeResponse(200, '"CrumbStore":{"crumb":"%s"}' % crumb,
+                                'text/html')
+
+        self.downcalls.append(url)
+        return FakeResponse(self.downstatus, CSVTEXT)
+
+
+# The tests patch the class level crumb cache, to leave no fake sessions behind
+def startdata(fake, dataname='YHOO', **kwargs):
+    data = bt.feeds.YahooFinanceData(dataname=dataname, **kwargs)
+    with mock.patch.dict(sys.modules, {'requests': fake.module}):
+        data.start_v7()
+
+    return data
+
+
+@mock.patch.dict(bt.feeds.YahooFinanceData._crumbs, clear=True)
+def test_crumb_reuse(main=False):
+    fake = FakeRequests()
+
+    data0 = startdata(fake, 'YHOO')
+    data1 = startdata(fake, 'ORCL')
+
+    assert data0.f is not None and data1.f is not None
+    assert len(fake.histcalls) == 1  # second data reuses the crumb
+    assert len(fake.sessions) == 1
+    assert all('crumb=abc' in url for url in fake.downcalls)
+
+
+@mock.patch.dict(bt.feeds.YahooFinanceData._crumbs, clear=True)
+def test_crumb_invalidation(main=False):
+
+    # crumb rejected by the server: not cached for the next instance
+    fake = FakeRequests(crumbs=('bad', 'bad'), downstatus=401)
+    data0 = startdata(fake, 'YHOO')
+    assert data0.f is None
+    assert len(fake.downcalls) == 1  # a rejected crumb is not retried
+    assert not bt.feeds.YahooFinanceData._crumbs
+
+    data1 = startdata(fake, 'ORCL')
+    assert data1.f is None
+    assert len(fake.histcalls) == 2  # a new crumb was fetched
+    assert all(sess.closed for sess in fake.sessions)  # rejected sessions
+
+    # a cached crumb which gets rejected is refetched once
+    bt.feeds.YahooFinanceData._crumbs.clear()
+    fake = FakeRequests(crumbs=('old', 'new'))
+    startdata(fake, 'YHOO')
+
+    def downstatus(url, get=fake.get):
+        fake.downstatus = 200 if 'crumb=new' in url else 401
+        return get(url)
+
+    fake.get = downstatus
+    data = startdata(fake, 'ORCL')
+    assert data.f is not None
+    assert data.error is None
+    assert len(fake.histcalls) == 2
+    assert 'crumb=old' in fake.downcalls[-2]
+    assert 'crumb=new' in fake.downcalls[-1]
+    assert fake.sessions[0].closed and not fake.sessions[1].closed
+
+
+@mock.patch.dict(bt.feeds.YahooFinanceData._crumbs, clear=True)
+def test_crumb_key(main=False):
+    fake = FakeRequests(crumbs=('abc', 'xyz'))
+
+    urlhist = 'https://other.yahoo.com/quote/{}/history'
+    startdata(fake, 'YHOO')
+    startdata(fake, 'ORCL', urlhist=urlhist)
+    startdata(fake, 'NVDA', urlhist=urlhist)
+
+    # different endpoints do not share the crumb and session
+    assert len(fake.histcalls) == 2
+    assert len(fake.sessions) == 2
+    assert 'crumb=xyz' in fake.downcalls[-1]
+
+    # a falsy proxies parameter is accepted and shares the default key
+    data = startdata(fake, 'KO', proxies=None)
+    assert data.f is not None
+    assert len(fake.histcalls) == 2
+
+
+@mock.patch.dict(bt.feeds.YahooFinanceData._crumbs, clear=True)
+def test_periods(main=False):
+    fromdate = datetime.datetime(2014, 1, 2)
+    todate = datetime.datetime(2014, 12, 31, 12, 30)
+    period1 = 'period1=1388620800'
+    period2 = 'period2=1419984000'  # the time of todate is not used
+
+    for kwargs, present, missing in [
+            (dict(fromdate=fromdate, todate=todate), [period1, period2], []),
+            (dict(fromdate=fromdate), [period1], ['period2']),
+            (dict(todate=todate), [period2], ['period1'])]:
+
+        bt.feeds.YahooFinanceData._crumbs.clear()
+        fake = FakeRequests()
+        startdata(fake, 'YHOO', **kwargs)
+
+        args = fake.downcalls[-1].split('?')[1].split('&')
+        assert all(arg in args for arg in present)
+        assert not any(arg.startswith(m) for arg in args for m in missing)
+
+
+def test_sessionend(main=False):
+    datapath = os.path.join(testcommon.modpath, testcommon.dataspath,
+                            'yhoo-2014.txt')
+    with open(datapath) as f:
+        dates = [line[0:10] for line in f.readlines()[1:]]
+
+    utcm5 = datetime.timezone(datetime.timedelta(hours=-5))
+    for sessionend in [datetime.time(23, 59, 59, 999990),
+                       datetime.time(16, 0),
+                       datetime.time(16, 0, tzinfo=utcm5)]:
+        cerebro = bt.Cerebro()
+        data = bt.feeds.YahooFinanceCSVData(dataname=datapath,
+                                            sessionend=sessionend)
+        cerebro.adddata(data)
+        cerebro.run()
+
+        # same values as converting a datetime per line with date2num
+        expected = [
+            bt.date2num(datetime.datetime.combine(
+                datetime.date.fromisoformat(d), sessionend))
+            for d in dates]
+        assert list(data.lines.datetime.array) == expected
+        if main:
+            print(sessionend, data.lines.datetime.array[0])
+
+
+def test_nonisodate(main=False):
+    datapath = os.path.join(testcommon.modpath, testcommon.dataspath,
+                            'yhoo-2014.txt')
+    with open(datapath) as f:
+        txt = f.read()
+
+    arrays = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        slashpath = os.path.join(tmpdir, 'yhoo-2014-slash.txt')
+        with open(slashpath, 'w') as f:
+            f.write(txt.replace('-', '/'))  # 2014-01-02 -> 2014/01/02
+
+        for dataname in [datapath, slashpath]:
+            cerebro = bt.Cerebro()
+            data = bt.feeds.YahooFinanceCSVData(dataname=dataname)
+            cerebro.adddata(data)
+            cerebro.run()
+            arrays.append([list(line.array) for line in data.lines])
+            assert data._isodate == (dataname == datapath)
+
+    assert arrays[0] == arrays[1]
+
+
+if __name__ == '__main__':
+    test_crumb_reuse(main=True)
+    test_crumb_invalidation(main=True)
+    test_crumb_key(main=True)
+    test_periods(main=True)
+    test_sessionend(main=True)
+    test_nonisodate(main=True)